@@ -1,33 +1,37 @@
 import sys
 from final_board import *
 from final_players import *
+from Connect4Store import PositionStore
 import random
 
 class Connect4:
     '''Instances of this class simulate an interactive Connect-4 game.'''
 
-    def __init__(self, opponent, toMove):
+    def __init__(self, opponent, toMove, rows=6, cols=7, k=4):
         '''
         Initializes the game.
 
         Arguments:
           opponent -- the computer opponent object
           toMove   -- the first player to move.  1 = human, 2 = computer.
+          rows     -- the number of rows on the board
+          cols     -- the number of columns on the board
+          k        -- the number of pieces in a row needed to win
         '''
         assert toMove in [1, 2]
         self.toMove = toMove
         self.opponent = opponent
-        self.board = Connect4Board()
+        self.board = Connect4Board(rows, cols, k)
         self.nrows = self.board.getRows()
         self.ncols = self.board.getCols()
-        self.moves = []
 
     def show(self):
         '''Print the board to the terminal, along with the player to move.'''
 
+        rule = '-' * (2 * self.ncols - 1)
         print()
-        print ('     top')
-        print ('-------------')
+        print ('top'.center(len(rule)))
+        print (rule)
         for row in range(self.nrows-1, -1, -1):
             for col in range(0, self.ncols):
                 val = self.board.get(row, col)
@@ -36,9 +40,10 @@ class Connect4:
                 else:
                     print ('%s ' % val, end = ''),
             print()
-        print ('-------------')
-        print ('0 1 2 3 4 5 6')
-        print ('   column')
+        print (rule)
+        # Only the last digit of wide column numbers fits in the ruler.
+        print (' '.join('%d' % (col % 10) for col in range(self.ncols)))
+        print ('column'.center(len(rule)))
         print()
 
     def makeMove(self, col, player):
@@ -53,7 +58,6 @@ class Connect4:
         if col < 0 or col >= self.ncols:
             raise MoveError('invalid move: %d' % col)
         self.board.makeMove(col, player)
-        self.moves.append((player, col))
 
     def unmakeMove(self):
         '''
@@ -63,9 +67,9 @@ class Connect4:
         Raise a MoveError exception if there are not enough moves to undo.
         '''
 
-        if len(self.moves) > 1:
-            self.board.unmakeMove(self.moves.pop()[1])
-            self.board.unmakeMove(self.moves.pop()[1])
+        if self.board.moveCount() > 1:
+            self.board.unmakeMove(self.board.lastMove())
+            self.board.unmakeMove(self.board.lastMove())
         else:
             raise MoveError('Not enough moves to undo!')
 
@@ -133,7 +137,13 @@ class Connect4:
                 print ('Board error; try again...', file = sys.stderr)
 
 if __name__ == '__main__':
-    players = ['random', 'simple', 'better', 'monty']
+    players = ['random', 'simple', 'better', 'monty', 'search']
+
+    # An optional argument names a position store, which keeps what the
+    # computer player learns between runs.
+    store = None
+    if len(sys.argv) > 1:
+        store = PositionStore(sys.argv[1])
 
     print('Computer players: %s' % players) 
     
@@ -149,7 +159,13 @@ if __name__ == '__main__':
         nsims = int(input('Enter number of simulations per move: '))
         assert nsims > 0
         player = SimplePlayer()
-        opponent = Monty(nsims, player)
+        opponent = Monty(nsims, player, store=store)
+    elif player == 'search':
+        depth = int(input('Enter search depth: '))
+        assert depth > 0
+        workers = int(input('Enter number of worker processes: '))
+        assert workers > 0
+        opponent = SearchPlayer(depth, workers)
     else:
         print ('Invalid player name.  Exiting.', file = sys.stderr)
         sys.exit(1)
@@ -161,5 +177,9 @@ if __name__ == '__main__':
     print()
 
     game = Connect4(opponent, toMove)
-    game.play()
+    try:
+        game.play()
+    finally:
+        if store is not None:
+            store.close()
 
@@ -0,0 +1,189 @@
+'''
+Connect4Ordering.py
+
+This module contains the move ordering used by the search-based players.
+Alpha-beta search prunes the most when the best move is tried first, so
+the order in which moves are tried matters a great deal.
+'''
+
+
+class MoveOrderer:
+    '''
+    Instances of this class put the legal moves of a position in the order
+    a search should try them:
+
+      1. a move which wins at once, if there is one ("threat-first");
+      2. the move suggested by the caller (e.g. from a transposition table),
+         then moves which block an immediate win by the opponent;
+      3. everything else, center-first.  Among columns as far from the
+         center as each other, the killer moves of this ply (moves which
+         recently caused a cutoff at the same distance from the root) come
+         first, then the rest by history score (how often and how deep a
+         move has caused cutoffs).
+
+    With threat-first ordering, a winning move found while ordering is
+    also left in the 'win' attribute (-1 if there is none), so that the
+    caller need not look for one again.  The history and killer tables
+    persist across the iterations of an iterative-deepening search.  Each
+    ordering source can be switched off, so that its effect on the cutoff
+    statistics can be measured.
+    '''
+
+    def __init__(self, cols, threatFirst=True, useKillers=True,
+                 useHistory=True, variation=0):
+        '''
+        Initialize the orderer.
+
+        Arguments:
+          cols        -- the number of columns on the board
+          threatFirst -- try winning and blocking moves first
+          useKillers  -- try killer moves early
+          useHistory  -- order the remaining moves by history score
+          variation   -- rotate the static order by this many places, so
+                         that parallel searches try moves in different
+                         orders (0 keeps it center-first)
+        '''
+
+        self.cols = cols
+        self.threatFirst = threatFirst
+        self.useKillers = useKillers
+        self.useHistory = useHistory
+
+        # The static order: columns nearest the center first.  Killers
+        # and history only reorder columns within a tier of the static
+        # order, i.e. columns the same distance from the center; letting
+        # them override it (so that a few cutoffs in an edge column put it
+        # ahead of the center) costs more nodes than it saves.
+        center = (cols - 1) / 2
+        self.static = sorted(range(cols), key=lambda c: abs(c - center))
+        tiers = [abs(2 * col - (cols - 1)) for col in self.static]
+        shift = variation % cols
+        self.static = self.static[shift:] + self.static[:shift]
+        self.rank = [0] * cols
+        self.tier = [0] * cols
+        for i, col in enumerate(self.static):
+            self.rank[col] = i
+            self.tier[col] = tiers[i]
+
+        # history[player][col]; killers[ply] is a list of up to two columns.
+        self.history = [None, [0] * cols, [0] * cols]
+        self.killers = []
+        self.win = -1
+        self.resetStats()
+
+    def resetStats(self):
+        '''
+        Reset the cutoff statistics.
+        '''
+
+        self.orderings    = 0  # positions whose moves were ordered
+        self.cutoffs      = 0  # beta cutoffs reported
+        self.firstCutoffs = 0  # cutoffs caused by the first move tried
+        self.cutoffIndex  = 0  # sum of the positions of the cutoff moves
+
+    def newSearch(self):
+        '''
+        Prepare for a new search.  Killer moves are forgotten and history
+        scores are halved, so that older information counts for less.
+        '''
+
+        self.killers = []
+        for player in (1, 2):
+            self.history[player] = [h // 2 for h in self.history[player]]
+
+    def order(self, board, player, ply, first=-1):
+        '''
+        Return the legal moves of a position in the order they should be
+        tried.
+
+        Arguments:
+          board  -- a Connect4Board instance
+          player -- the player to move (1 or 2)
+          ply    -- the distance of the position from the root
+          first  -- a move to try before all others except a winning
+                    move, or -1 for none
+
+        Invariant: The board state does not change.
+        '''
+
+        self.orderings += 1
+        self.win = -1
+        mask = board.possibleMovesMask()
+        moves = [col for col in self.static if mask >> col & 1]
+        if len(moves) < 2:
+            if (moves and self.threatFirst
+                    and board.isWinningMove(moves[0], player)):
+                self.win = moves[0]
+            return moves
+
+        history = self.history[player] if self.useHistory else None
+        killers = ()
+        if self.useKillers and ply < len(self.killers):
+            killers = self.killers[ply]
+        opponent = 3 - player
+        keys = {}
+        for col in moves:
+            if self.threatFirst and board.isWinningMove(col, player):
+                # Nothing can be better, so the other moves need no keys.
+                self.win = col
+                moves.remove(col)
+                moves.insert(0, col)
+                return moves
+            elif col == first:
+                key = 1
+            elif self.threatFirst and board.isWinningMove(col, opponent):
+                key = 2
+            else:
+                key = 3
+            keys[col] = (key, self.tier[col], col not in killers,
+                         -history[col] if history else 0, self.rank[col])
+        moves.sort(key=keys.__getitem__)
+        return moves
+
+    def cutoff(self, player, col, ply, depth, index):
+        '''
+        Record that a move caused a beta cutoff.
+
+        Arguments:
+          player -- the player who made the move
+          col    -- the move
+          ply    -- the distance of the position from the root
+          depth  -- the remaining depth of the search at the position
+          index  -- the position of the move in the order it was tried
+        '''
+
+        self.cutoffs += 1
+        self.cutoffIndex += index
+        if index == 0:
+            self.firstCutoffs += 1
+        if self.useHistory:
+            self.history[player][col] += depth * depth
+        if self.useKillers:
+            while len(self.killers) <= ply:
+                self.killers.append([])
+            killers = self.killers[ply]
+            if col not in killers:
+                killers.insert(0, col)
+                del killers[2:]
+
+    def stats(self):
+        '''
+        Return the cutoff statistics as a dictionary:
+
+          orderings       -- positions whose moves were ordered
+          cutoffs         -- beta cutoffs reported
+          firstCutoffRate -- the fraction of cutoffs caused by the first
+                             move tried (1.0 is perfect ordering)
+          meanCutoffIndex -- the mean position of the cutoff moves in the
+                             order they were tried (0.0 is perfect)
+        '''
+
+        if self.cutoffs:
+            firstRate = self.firstCutoffs / self.cutoffs
+            meanIndex = self.cutoffIndex / self.cutoffs
+        else:
+            firstRate = meanIndex = 0.0
+        return {'orderings': self.orderings,
+                'cutoffs': self.cutoffs,
+                'firstCutoffRate': firstRate,
+                'meanCutoffIndex': meanIndex}
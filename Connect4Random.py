@@ -0,0 +1,159 @@
+'''
+Connect4Random.py
+
+This module contains seeded random number streams for the computer players
+and the simulator, so that games and simulations can be reproduced exactly.
+'''
+
+import hashlib
+import random
+import sys
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# For each legal-move mask seen so far: the tuple of its set bits, their
+# number, and the rejection limit for choosing one of them from a 32-bit
+# word.  There are at most 2 ** cols masks for a board.
+_maskChoices = {}
+
+
+def streamSeed(seed, worker):
+    '''
+    Return the seed of the stream for a given worker.  Seeds are derived by
+    hashing, so the streams of different workers are independent of each
+    other and do not depend on how many workers there are.
+    '''
+
+    digest = hashlib.sha256(('%d:%d' % (seed, worker)).encode()).digest()
+    return int.from_bytes(digest[:8], 'little')
+
+
+class RandomStream:
+    '''
+    Instances of this class are seeded streams of random numbers.
+
+    Random bits are drawn in blocks of 32-bit words and handed out one word
+    at a time.  choiceMask() picks a move straight from a legal-move mask in
+    a little more time than random.choice() takes on a ready-made list, and
+    in about a third of the time of building the list and then choosing.
+    The same seed, worker and backend always give the same sequence of
+    choices.
+    '''
+
+    def __init__(self, seed=None, worker=0, backend='python', blockSize=1024):
+        '''
+        Initialize the stream.
+
+        Arguments:
+          seed      -- the seed shared by all workers, or None to pick one
+                       at random
+          worker    -- the number of the worker this stream belongs to
+          backend   -- 'python' to draw blocks with the 'random' module, or
+                       'numpy' to draw them with a NumPy Generator
+          blockSize -- the number of 32-bit words to draw at a time
+        '''
+
+        assert backend in ['python', 'numpy']
+        assert blockSize > 0
+        if backend == 'numpy' and numpy is None:
+            raise ImportError('the numpy backend requires NumPy')
+        if seed is None:
+            seed = random.SystemRandom().getrandbits(64)
+        self.seed = seed
+        self.worker = worker
+        self.backend = backend
+        self.blockSize = blockSize
+        if backend == 'numpy':
+            self.generator = numpy.random.Generator(
+                numpy.random.PCG64(streamSeed(seed, worker)))
+        else:
+            self.generator = random.Random(streamSeed(seed, worker))
+        self.words = []
+        self.index = 0
+
+    def spawn(self, worker):
+        '''
+        Return the stream for another worker, with the same seed and
+        backend as this one.
+        '''
+
+        return RandomStream(self.seed, worker, self.backend, self.blockSize)
+
+    def refill(self):
+        '''
+        Draw the next block of random words.
+        '''
+
+        if self.backend == 'numpy':
+            self.words = self.generator.integers(
+                0, 1 << 32, size=self.blockSize, dtype=numpy.uint32).tolist()
+        else:
+            self.words = array('I',
+                               self.generator.randbytes(4 * self.blockSize))
+            # Read the bytes as little-endian words on every platform.
+            if sys.byteorder == 'big':
+                self.words.byteswap()
+        self.index = 0
+
+    def nextWord(self):
+        '''
+        Return the next random 32-bit word.
+        '''
+
+        if self.index == len(self.words):
+            self.refill()
+        word = self.words[self.index]
+        self.index += 1
+        return word
+
+    def randbelow(self, n):
+        '''
+        Return a random integer in the range [0, n).
+        '''
+
+        assert 0 < n <= 1 << 32
+        # Reject the few words above the largest multiple of n, so that
+        # every result is equally likely.
+        limit = (1 << 32) - (1 << 32) % n
+        while True:
+            word = self.nextWord()
+            if word < limit:
+                return word % n
+
+    def choice(self, seq):
+        '''
+        Return a random element of a non-empty sequence.
+        '''
+
+        return seq[self.randbelow(len(seq))]
+
+    def choiceMask(self, mask):
+        '''
+        Return the index of a random set bit of a non-zero bit mask, such
+        as the legal-move mask of a board.  This is called at every ply of
+        every rollout, so it reads the word buffer itself rather than going
+        through randbelow().
+        '''
+
+        entry = _maskChoices.get(mask)
+        if entry is None:
+            assert mask > 0
+            columns = tuple(i for i in range(mask.bit_length())
+                            if mask >> i & 1)
+            n = len(columns)
+            entry = (columns, n, (1 << 32) - (1 << 32) % n)
+            _maskChoices[mask] = entry
+        columns, n, limit = entry
+        while True:
+            index = self.index
+            if index == len(self.words):
+                self.refill()
+                index = 0
+            word = self.words[index]
+            self.index = index + 1
+            if word < limit:
+                return columns[word % n]
@@ -0,0 +1,631 @@
+'''
+Connect4Search.py
+
+This module contains an alpha-beta search engine for Connect-4 boards, and a
+"lazy SMP" parallel mode in which several worker processes search the same
+position at staggered depths while sharing one transposition table.
+'''
+
+import pickle
+import queue
+import random
+import time
+import traceback
+import multiprocessing
+from array import array
+from multiprocessing import shared_memory
+from Connect4Ordering import MoveOrderer
+
+# Scores at or above WIN_THRESHOLD (in absolute value) are forced wins or
+# losses; the distance to the win is folded into the score so that quicker
+# wins are preferred.
+WIN_SCORE     = 10000
+WIN_THRESHOLD = WIN_SCORE - 1000
+
+# Transposition table entry flags.
+EXACT = 0
+LOWER = 1
+UPPER = 2
+
+# How often (in nodes) a worker checks whether it has been told to stop.
+STOP_CHECK_INTERVAL = 1024
+
+# How long (in seconds) the parent waits for a result before checking
+# whether the workers are still alive.
+WORKER_POLL_INTERVAL = 0.5
+
+
+class SearchAborted(Exception):
+    '''
+    Instances of this class are exceptions which are raised inside a
+    search when another process has asked the search to stop.
+    '''
+    pass
+
+
+class SearchWorkerError(Exception):
+    '''
+    Instances of this class are exceptions which carry the traceback of a
+    failed worker process, or report that a worker died without a result.
+    '''
+    pass
+
+
+class TranspositionTable:
+    '''
+    Instances of this class manage a fixed-size transposition table.  A
+    shared table is stored in a block of shared memory, so that it can be
+    used by several processes at once; a table which is not shared is an
+    ordinary array in this process.
+
+    Each slot is a pair of 64-bit words (key ^ data, data).  Entries are
+    written and read without any locking: a reader recovers the key from
+    the two words and rejects the entry if it does not match, which also
+    catches entries that were torn by a concurrent write.
+    '''
+
+    def __init__(self, size=1 << 20, name=None, shared=True):
+        '''
+        Create a new table, or attach to an existing one.
+
+        Arguments:
+          size   -- the number of slots in the table
+          name   -- the name of an existing shared memory block to attach
+                    to, or None to create a new table
+          shared -- whether a new table is put in shared memory
+        '''
+
+        assert size > 0
+        self.size = size
+        self.owner = name is None
+        if not shared:
+            assert name is None
+            self.shm = None
+            self.slots = array('Q', bytes(16 * size))
+            return
+        if self.owner:
+            self.shm = shared_memory.SharedMemory(create=True, size=16 * size)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        # The block may be rounded up to a whole number of pages; only the
+        # first 2 * size words are used.
+        self.slots = self.shm.buf.cast('Q')
+
+    def getName(self):
+        '''
+        Return the name of the shared memory block holding the table, or
+        None if the table is not shared.
+        '''
+
+        return self.shm.name if self.shm is not None else None
+
+    def probe(self, key):
+        '''
+        Look up a position in the table.
+
+        Arguments:
+          key -- the 64-bit hash key of the position
+
+        Return value: a tuple (score, depth, flag, move) if the position is
+        in the table, else None.  'move' is -1 if no move was stored.
+        '''
+
+        index = 2 * (key % self.size)
+        data = self.slots[index + 1]
+        if self.slots[index] ^ data != key or data == 0:
+            return None
+        score = (data & 0xffff) - 0x8000
+        depth = (data >> 16) & 0xff
+        flag  = (data >> 24) & 0x3
+        move  = ((data >> 26) & 0xff) - 1
+        return (score, depth, flag, move)
+
+    def store(self, key, score, depth, flag, move):
+        '''
+        Store a position in the table, replacing whatever was in its slot.
+
+        Arguments:
+          key   -- the 64-bit hash key of the position
+          score -- the score of the position
+          depth -- the depth the position was searched to
+          flag  -- one of EXACT, LOWER or UPPER
+          move  -- the best move found, or -1 if there is none
+        '''
+
+        index = 2 * (key % self.size)
+        data = ((score + 0x8000) | (min(depth, 0xff) << 16) | (flag << 24)
+                | ((move + 1) << 26))
+        self.slots[index]     = key ^ data
+        self.slots[index + 1] = data
+
+    def clear(self):
+        '''
+        Remove all entries from the table.
+        '''
+
+        self.slots[:2 * self.size] = array('Q', bytes(16 * self.size))
+
+    def close(self):
+        '''
+        Detach from the table.  The process that created a shared table
+        also frees the shared memory block.
+        '''
+
+        if self.shm is None:
+            return
+        self.slots.release()
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+class SearchResult:
+    '''
+    Instances of this class hold the outcome of a search.
+    '''
+
+    def __init__(self, move, score, depth, nodes, elapsed):
+        '''
+        Arguments:
+          move    -- the best move found
+          score   -- the score of the best move for the player to move
+          depth   -- the depth that was fully searched
+          nodes   -- a list of node counts, one per worker
+          elapsed -- the wall-clock time of the search in seconds
+        '''
+
+        self.move    = move
+        self.score   = score
+        self.depth   = depth
+        self.nodes   = nodes
+        self.elapsed = elapsed
+        # The move ordering statistics of the search (see MoveOrderer.stats).
+        self.ordering = None
+        # Filled in by measureSpeedup().
+        self.speedup = None
+
+    def totalNodes(self):
+        '''
+        Return the number of nodes searched by all workers.
+        '''
+
+        return sum(self.nodes)
+
+    def nodesPerSecond(self):
+        '''
+        Return the number of nodes searched per second by all workers.
+        '''
+
+        if self.elapsed <= 0:
+            return 0.0
+        return self.totalNodes() / self.elapsed
+
+    def __repr__(self):
+        return ('SearchResult(move=%d, score=%d, depth=%d, nodes=%s, '
+                'elapsed=%.3f, speedup=%s)'
+                % (self.move, self.score, self.depth, self.nodes,
+                   self.elapsed, self.speedup))
+
+
+# Zobrist tables computed so far, keyed by board size.
+_zobristTables = {}
+
+
+def zobristTable(rows, cols):
+    '''
+    Return a table of random 64-bit keys, indexed by [player][cell], for
+    hashing positions on a board of the given size.  The table is the same
+    in every process, so keys can be shared through the table.
+    '''
+
+    table = _zobristTables.get((rows, cols))
+    if table is None:
+        rng = random.Random(0x436f6e6e656374)
+        table = [None] + [[rng.getrandbits(64) for cell in range(rows * cols)]
+                          for player in (1, 2)]
+        _zobristTables[(rows, cols)] = table
+    return table
+
+
+class Searcher:
+    '''
+    Instances of this class run an iterative-deepening alpha-beta (negamax)
+    search on a Connect-4 board.
+    '''
+
+    def __init__(self, table, stop=None, stagger=0, orderer=None):
+        '''
+        Initialize the searcher.
+
+        Arguments:
+          table   -- the TranspositionTable to use
+          stop    -- an optional multiprocessing.Event; the search is
+                     aborted when it is set
+          stagger -- added to every depth of the iterative deepening, so
+                     that parallel workers search different depths
+          orderer -- the MoveOrderer to use; a default one is made for
+                     the board if None
+        '''
+
+        self.table   = table
+        self.stop    = stop
+        self.stagger = stagger
+        self.orderer = orderer
+        self.nodes   = 0
+
+    def setup(self, board):
+        '''
+        Compute the hash key, column heights and evaluation of a board.
+        '''
+
+        self.board   = board
+        self.rows    = board.getRows()
+        self.cols    = board.getCols()
+        self.zobrist = zobristTable(self.rows, self.cols)
+        self.weights = board.getGeometry().weights
+        self.heights = [0] * self.cols
+        self.key     = 0
+        self.value   = 0  # evaluation from player 1's point of view
+        for col in range(self.cols):
+            for row in range(self.rows):
+                val = board.get(row, col)
+                if val == 0:
+                    break
+                cell = row * self.cols + col
+                self.heights[col] = row + 1
+                self.key ^= self.zobrist[val][cell]
+                if val == 1:
+                    self.value += self.weights[cell]
+                else:
+                    self.value -= self.weights[cell]
+        if self.orderer is None:
+            self.orderer = MoveOrderer(self.cols)
+        self.orderer.newSearch()
+
+    def search(self, board, player, depth):
+        '''
+        Search a position by iterative deepening.
+
+        Arguments:
+          board  -- a Connect4Board instance
+          player -- the player to move (1 or 2)
+          depth  -- the maximum depth to search
+
+        Return value: a tuple (move, score, depth) for the deepest search
+        that completed.
+
+        Precondition: There must be at least one legal move.
+        Invariant: The board state does not change.
+        '''
+
+        assert player in [1, 2]
+        assert board.possibleMoves() != []
+        self.setup(board)
+        result = None
+        try:
+            for d in range(1 + self.stagger, depth + self.stagger + 1):
+                score, move = self.root(player, d)
+                result = (move, score, d)
+                # There is no point searching deeper once the result is
+                # a forced win or loss.
+                if abs(score) >= WIN_THRESHOLD:
+                    break
+        except SearchAborted:
+            # Restore the board: unwind whatever moves are still on it.
+            self.unwind()
+        return result
+
+    def root(self, player, depth):
+        '''
+        Search the root position to a fixed depth.
+
+        Return value: a tuple (score, move).
+        '''
+
+        self.path = []
+        score = self.negamax(player, depth, -WIN_SCORE, WIN_SCORE, 0)
+        return score, self.rootMove
+
+    def play(self, col, player):
+        '''
+        Make a move, updating the key and evaluation.
+        '''
+
+        cell = self.heights[col] * self.cols + col
+        self.board.makeMove(col, player)
+        self.heights[col] += 1
+        self.key ^= self.zobrist[player][cell]
+        if player == 1:
+            self.value += self.weights[cell]
+        else:
+            self.value -= self.weights[cell]
+        self.path.append((col, player))
+
+    def undo(self):
+        '''
+        Unmake the last move made by play().
+        '''
+
+        col, player = self.path.pop()
+        self.board.unmakeMove(col)
+        self.heights[col] -= 1
+        cell = self.heights[col] * self.cols + col
+        self.key ^= self.zobrist[player][cell]
+        if player == 1:
+            self.value -= self.weights[cell]
+        else:
+            self.value += self.weights[cell]
+
+    def unwind(self):
+        '''
+        Unmake all the moves made by play().
+        '''
+
+        while self.path:
+            self.undo()
+
+    def negamax(self, player, depth, alpha, beta, ply):
+        '''
+        Search the current position to a fixed depth.
+
+        Arguments:
+          player -- the player to move
+          depth  -- the remaining depth
+          alpha  -- the lower bound of the search window
+          beta   -- the upper bound of the search window
+          ply    -- the distance from the root
+
+        Return value: the score of the position for the player to move.
+        '''
+
+        self.nodes += 1
+        if self.stop is not None and self.nodes % STOP_CHECK_INTERVAL == 0:
+            if self.stop.is_set():
+                raise SearchAborted()
+
+        if self.board.isDraw():
+            return 0
+        if depth == 0:
+            return self.value if player == 1 else -self.value
+
+        # Check the transposition table.  Win and loss scores are stored
+        # relative to the node, not the root.
+        alphaOrig = alpha
+        ttMove = -1
+        entry = self.table.probe(self.key)
+        if entry is not None:
+            score, entryDepth, flag, ttMove = entry
+            if score >= WIN_THRESHOLD:
+                score -= ply
+            elif score <= -WIN_THRESHOLD:
+                score += ply
+            # Never cut off at the root, where the move itself is needed.
+            if entryDepth >= depth and ply > 0:
+                if flag == EXACT:
+                    return score
+                elif flag == LOWER:
+                    alpha = max(alpha, score)
+                else:
+                    beta = min(beta, score)
+                if alpha >= beta:
+                    return score
+
+        moves = self.orderer.order(self.board, player, ply, ttMove)
+
+        # A move which wins at once is always best.  A threat-first
+        # orderer has already looked for one.
+        if self.orderer.threatFirst:
+            win = self.orderer.win
+        else:
+            win = -1
+            for col in moves:
+                if self.board.isWinningMove(col, player):
+                    win = col
+                    break
+        if win >= 0:
+            score = WIN_SCORE - ply - 1
+            if ply == 0:
+                self.rootMove = win
+            self.save(score, depth, EXACT, win, ply)
+            return score
+
+        best = -WIN_SCORE
+        bestMove = moves[0]
+        for index, col in enumerate(moves):
+            self.play(col, player)
+            try:
+                score = -self.negamax(3 - player, depth - 1, -beta, -alpha,
+                                      ply + 1)
+            finally:
+                self.undo()
+            if score > best:
+                best = score
+                bestMove = col
+            alpha = max(alpha, score)
+            if alpha >= beta:
+                self.orderer.cutoff(player, col, ply, depth, index)
+                break
+
+        if best <= alphaOrig:
+            flag = UPPER
+        elif best >= beta:
+            flag = LOWER
+        else:
+            flag = EXACT
+        self.save(best, depth, flag, bestMove, ply)
+        if ply == 0:
+            self.rootMove = bestMove
+        return best
+
+    def save(self, score, depth, flag, move, ply):
+        '''
+        Store the current position in the transposition table.
+        '''
+
+        if score >= WIN_THRESHOLD:
+            score += ply
+        elif score <= -WIN_THRESHOLD:
+            score -= ply
+        self.table.store(self.key, score, depth, flag, move)
+
+
+def search(board, player, depth, table=None):
+    '''
+    Search a position in this process.
+
+    Arguments:
+      board  -- a Connect4Board instance
+      player -- the player to move (1 or 2)
+      depth  -- the maximum depth to search
+      table  -- an optional TranspositionTable; a new table, private to
+                this process, is made if None
+
+    Return value: a SearchResult.
+
+    Precondition: There must be at least one legal move.
+    Invariant: The board state does not change.
+    '''
+
+    if table is None:
+        table = TranspositionTable(shared=False)
+    searcher = Searcher(table)
+    start = time.perf_counter()
+    move, score, d = searcher.search(board, player, depth)
+    elapsed = time.perf_counter() - start
+    result = SearchResult(move, score, d, [searcher.nodes], elapsed)
+    result.ordering = searcher.orderer.stats()
+    return result
+
+
+def _worker(workerId, board, player, depth, tableName, tableSize, stop,
+            results):
+    '''
+    Run one lazy SMP worker.  So that the workers fill the shared table
+    with different parts of the tree, worker n searches (n + 1) // 2 plies
+    deeper than worker 0 at each iteration, and tries moves in its own
+    order.  The worker always reports back, with its exception if it
+    fails.
+    '''
+
+    table = TranspositionTable(tableSize, tableName)
+    orderer = MoveOrderer(board.getCols(), variation=workerId)
+    searcher = Searcher(table, stop, (workerId + 1) // 2, orderer)
+    result = None
+    error = None
+    try:
+        result = searcher.search(board, player, depth)
+    except BaseException as e:
+        text = traceback.format_exc()
+        try:
+            pickle.dumps(e)
+        except Exception:
+            e = SearchWorkerError(text)
+        error = (e, text)
+    finally:
+        results.put((workerId, result, searcher.nodes, orderer.stats(),
+                     error))
+        table.close()
+
+
+def parallelSearch(board, player, depth, workers=None, tableSize=1 << 20):
+    '''
+    Search a position with several worker processes sharing one
+    transposition table ("lazy SMP").  The result of worker 0, which
+    searches exactly the requested depths, is returned; the other workers
+    only help by filling the table, and are stopped once worker 0 is done.
+
+    Arguments:
+      board     -- a Connect4Board instance
+      player    -- the player to move (1 or 2)
+      depth     -- the maximum depth to search
+      workers   -- the number of worker processes (default: one per CPU)
+      tableSize -- the number of slots in the shared table
+
+    Return value: a SearchResult, with one node count per worker.
+
+    Precondition: There must be at least one legal move.
+    Invariant: The board state does not change.
+    '''
+
+    assert player in [1, 2]
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    assert workers > 0
+
+    table   = TranspositionTable(tableSize)
+    stop    = multiprocessing.Event()
+    results = multiprocessing.Queue()
+    nodes   = [0] * workers
+    procs   = []
+    try:
+        start = time.perf_counter()
+        for workerId in range(workers):
+            proc = multiprocessing.Process(
+                target=_worker,
+                args=(workerId, board, player, depth, table.getName(),
+                      tableSize, stop, results))
+            proc.start()
+            procs.append(proc)
+
+        best = None
+        pending = set(range(workers))
+        while pending:
+            try:
+                workerId, result, workerNodes, stats, error = \
+                    results.get(timeout=WORKER_POLL_INTERVAL)
+            except queue.Empty:
+                # A worker which has exited may still have a result on the
+                # way; only give up on it if none arrives in time.
+                dead = [w for w in pending if procs[w].exitcode is not None]
+                if not dead:
+                    continue
+                try:
+                    workerId, result, workerNodes, stats, error = \
+                        results.get(timeout=WORKER_POLL_INTERVAL)
+                except queue.Empty:
+                    if 0 in dead:
+                        raise SearchWorkerError(
+                            'search worker 0 exited with code %d without a '
+                            'result' % procs[0].exitcode)
+                    pending.difference_update(dead)
+                    continue
+            pending.discard(workerId)
+            nodes[workerId] = workerNodes
+            if error is not None:
+                e, text = error
+                raise e from SearchWorkerError(
+                    'in search worker %d:\n%s' % (workerId, text))
+            if workerId == 0:
+                if result is None:
+                    raise SearchWorkerError('search worker 0 has no result')
+                best = result
+                ordering = stats
+                elapsed = time.perf_counter() - start
+                stop.set()
+    finally:
+        stop.set()
+        for proc in procs:
+            proc.join(1)
+            if proc.is_alive():
+                proc.terminate()
+                proc.join()
+        table.close()
+
+    move, score, d = best
+    result = SearchResult(move, score, d, nodes, elapsed)
+    result.ordering = ordering
+    return result
+
+
+def measureSpeedup(board, player, depth, workers=None, tableSize=1 << 20):
+    '''
+    Search a position once in this process and once in parallel, each with
+    an empty table, and return the parallel SearchResult with its 'speedup'
+    set to the ratio of the two search times.
+    '''
+
+    table = TranspositionTable(tableSize, shared=False)
+    serial = search(board, player, depth, table)
+    result = parallelSearch(board, player, depth, workers, tableSize)
+    result.speedup = serial.elapsed / result.elapsed
+    return result
@@ -6,6 +6,7 @@ players.
 '''
 
 import random
+from Connect4Random import RandomStream
 
 class Connect4Simulator:
     '''
@@ -13,15 +14,19 @@ class Connect4Simulator:
     particular board state.
     '''
 
-    def __init__(self, board, player1, player2, toMove):
+    def __init__(self, board, player1, player2, toMove, rng=None):
         '''
         Initialize the simulator.  
 
         Arguments:
           board   -- the current board state (a Connect4Board)
-          player1 -- the player who is player 1
-          player2 -- the player who is player 2
+          player1 -- the player who is player 1, or None for a player
+                     who makes random legal moves
+          player2 -- the player who is player 2, or None as for player1
           toMove  -- the next player to move (1 or 2)
+          rng     -- the RandomStream that the random players draw their
+                     moves from; a stream with a random seed is used if
+                     None
         '''
 
         assert toMove in [1, 2]
@@ -29,6 +34,21 @@ class Connect4Simulator:
         self.player1 = player1
         self.player2 = player2
         self.toMove  = toMove
+        if rng is None and (player1 is None or player2 is None):
+            rng = RandomStream()
+        self.rng     = rng
+        # The moves of the game being rolled out, reused from game to game.
+        self.moves   = [0] * (board.getRows() * board.getCols())
+
+    def chooseMove(self, toMove):
+        '''
+        Return the move of the player to move on the simulator's board.
+        '''
+
+        player = self.player1 if toMove == 1 else self.player2
+        if player is None:
+            return self.rng.choiceMask(self.board.possibleMovesMask())
+        return player.chooseMove(self.board, toMove)
 
     def simulate(self):
         '''
@@ -44,10 +64,7 @@ class Connect4Simulator:
             return 0
 
         while True:
-            if self.toMove == 1:
-                move = self.player1.chooseMove(self.board, 1)
-            else:
-                move = self.player2.chooseMove(self.board, 2)
+            move = self.chooseMove(self.toMove)
 
             self.board.makeMove(move, self.toMove)
             if self.board.isWin(move):
@@ -57,3 +74,53 @@ class Connect4Simulator:
             else:
                 self.toMove = 3 - self.toMove
 
+
+    def rollout(self):
+        '''
+        Simulate a game from the current position to completion on the
+        board itself, then undo all of its moves, so that the board is
+        left as it was.  Nothing is copied, so many games can be played
+        from one position cheaply.  Unlike simulate(), this does not
+        change the player to move.
+
+        Return value: as for simulate()
+        '''
+
+        board = self.board
+        moves = self.moves
+        count = 0
+        toMove = self.toMove
+        try:
+            if board.isDraw():
+                return 0
+            while True:
+                move = self.chooseMove(toMove)
+
+                board.makeMove(move, toMove)
+                moves[count] = move
+                count += 1
+                if board.isWin(move):
+                    return toMove
+                elif board.isDraw():
+                    return 0
+                else:
+                    toMove = 3 - toMove
+        finally:
+            # Unwind the game, last move first.
+            while count > 0:
+                count -= 1
+                board.unmakeMove(moves[count])
+
+    def simulate_many(self, n):
+        '''
+        Simulate 'n' games from the current position with rollout().
+
+        Return value: a list [draws, player 1 wins, player 2 wins], so
+        that the result of a game indexes its count.
+        '''
+
+        assert n >= 0
+        results = [0, 0, 0]
+        for i in range(n):
+            results[self.rollout()] += 1
+        return results
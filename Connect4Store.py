@@ -0,0 +1,234 @@
+'''
+Connect4Store.py
+
+This module contains a persistent store of what the engines have learned
+about positions: exact values from the solver and rollout statistics from
+Monty.  The store is an SQLite database, so it survives restarts and can
+be read by several worker processes at once.
+
+Run "python Connect4Store.py compact PATH [MIN_GAMES]" to compact a store,
+or "python Connect4Store.py stats PATH" to summarize one.
+'''
+
+import sqlite3
+import sys
+
+
+class PositionStore:
+    '''
+    Instances of this class manage a store of positions, each keyed by a
+    board's compact key (see Connect4Board.key) and the player to move.
+
+    Writes are buffered in memory and written in one transaction when the
+    buffer is full, or when flush() or close() is called; reads see the
+    buffered writes too.  The database uses write-ahead logging, so other
+    processes can read it while this one writes.  Each process should open
+    its own PositionStore rather than share one.
+    '''
+
+    def __init__(self, path, batchSize=1000, timeout=30.0):
+        '''
+        Open a store, creating it if it does not exist.
+
+        Arguments:
+          path      -- the path of the database file
+          batchSize -- the number of buffered positions which causes the
+                       buffer to be written out
+          timeout   -- how many seconds to wait for another process which
+                       is writing to the store
+        '''
+
+        assert batchSize > 0
+        self.path = path
+        self.batchSize = batchSize
+        self.db = sqlite3.connect(path, timeout=timeout)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute('''CREATE TABLE IF NOT EXISTS positions (
+                               key      BLOB    NOT NULL,
+                               toMove   INTEGER NOT NULL,
+                               score    INTEGER,
+                               distance INTEGER,
+                               draws    INTEGER NOT NULL DEFAULT 0,
+                               wins1    INTEGER NOT NULL DEFAULT 0,
+                               wins2    INTEGER NOT NULL DEFAULT 0,
+                               PRIMARY KEY (key, toMove)
+                           ) WITHOUT ROWID''')
+        self.db.commit()
+        # Buffered writes, keyed by (key, toMove): solved values as
+        # (score, distance), and rollout counts as [draws, wins1, wins2].
+        self.solved = {}
+        self.rollouts = {}
+
+    def getSolved(self, board, player):
+        '''
+        Look up the exact value of a position.
+
+        Arguments:
+          board  -- a Connect4Board instance
+          player -- the player to move (1 or 2)
+
+        Return value: a tuple (score, distance) as computed by the solver,
+        or None if the position has not been solved.
+        '''
+
+        key = (board.key(), player)
+        if key in self.solved:
+            return self.solved[key]
+        row = self.db.execute('SELECT score, distance FROM positions '
+                              'WHERE key = ? AND toMove = ?', key).fetchone()
+        if row is None or row[0] is None:
+            return None
+        return row
+
+    def putSolved(self, board, player, score, distance):
+        '''
+        Record the exact value of a position.
+
+        Arguments:
+          board    -- a Connect4Board instance
+          player   -- the player to move (1 or 2)
+          score    -- the exact score for the player to move
+          distance -- the number of moves until the end of the game
+        '''
+
+        self.solved[(board.key(), player)] = (score, distance)
+        self.written()
+
+    def getRollouts(self, board, player):
+        '''
+        Look up the rollout statistics of a position.
+
+        Arguments:
+          board  -- a Connect4Board instance
+          player -- the player to move (1 or 2)
+
+        Return value: a list [draws, player 1 wins, player 2 wins] of the
+        simulated games recorded from this position (all 0 if none).
+        '''
+
+        key = (board.key(), player)
+        row = self.db.execute('SELECT draws, wins1, wins2 FROM positions '
+                              'WHERE key = ? AND toMove = ?', key).fetchone()
+        results = list(row) if row is not None else [0, 0, 0]
+        pending = self.rollouts.get(key)
+        if pending is not None:
+            for i in range(3):
+                results[i] += pending[i]
+        return results
+
+    def addRollouts(self, board, player, results):
+        '''
+        Add to the rollout statistics of a position.
+
+        Arguments:
+          board   -- a Connect4Board instance
+          player  -- the player to move (1 or 2)
+          results -- a list [draws, player 1 wins, player 2 wins], as
+                     returned by Connect4Simulator.simulate_many
+        '''
+
+        key = (board.key(), player)
+        pending = self.rollouts.get(key)
+        if pending is None:
+            self.rollouts[key] = list(results)
+        else:
+            for i in range(3):
+                pending[i] += results[i]
+        self.written()
+
+    def written(self):
+        '''
+        Write out the buffer if it is full.
+        '''
+
+        if len(self.solved) + len(self.rollouts) >= self.batchSize:
+            self.flush()
+
+    def flush(self):
+        '''
+        Write all buffered positions to the database in one transaction.
+        '''
+
+        if not self.solved and not self.rollouts:
+            return
+        with self.db:
+            self.db.executemany(
+                'INSERT INTO positions (key, toMove, score, distance) '
+                'VALUES (?, ?, ?, ?) ON CONFLICT (key, toMove) DO UPDATE '
+                'SET score = excluded.score, distance = excluded.distance',
+                [key + value for key, value in self.solved.items()])
+            self.db.executemany(
+                'INSERT INTO positions (key, toMove, draws, wins1, wins2) '
+                'VALUES (?, ?, ?, ?, ?) ON CONFLICT (key, toMove) DO UPDATE '
+                'SET draws = draws + excluded.draws, '
+                'wins1 = wins1 + excluded.wins1, '
+                'wins2 = wins2 + excluded.wins2',
+                [key + tuple(value) for key, value in self.rollouts.items()])
+        self.solved = {}
+        self.rollouts = {}
+
+    def count(self):
+        '''
+        Return a tuple (positions, solved positions, simulated games) for
+        the whole store, including buffered writes.
+        '''
+
+        self.flush()
+        return self.db.execute(
+            'SELECT COUNT(*), COUNT(score), '
+            'COALESCE(SUM(draws + wins1 + wins2), 0) FROM positions'
+        ).fetchone()
+
+    def compact(self, minGames=0):
+        '''
+        Compact the store: drop the rollout statistics of positions with
+        fewer than 'minGames' simulated games (and the positions, if they
+        are not solved), then rebuild the database file and truncate its
+        log.  No other process should be writing to the store meanwhile.
+
+        Return value: the number of positions dropped.
+        '''
+
+        self.flush()
+        with self.db:
+            dropped = self.db.execute(
+                'DELETE FROM positions WHERE score IS NULL AND '
+                'draws + wins1 + wins2 < ?', (minGames,)).rowcount
+            self.db.execute(
+                'UPDATE positions SET draws = 0, wins1 = 0, wins2 = 0 '
+                'WHERE draws + wins1 + wins2 < ?', (minGames,))
+        self.db.execute('VACUUM')
+        self.db.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        return dropped
+
+    def close(self):
+        '''
+        Write out the buffer and close the store.
+        '''
+
+        self.flush()
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+if __name__ == '__main__':
+    usage = ('usage: python Connect4Store.py compact PATH [MIN_GAMES]\n'
+             '       python Connect4Store.py stats PATH')
+    if len(sys.argv) < 3 or sys.argv[1] not in ['compact', 'stats']:
+        print(usage, file = sys.stderr)
+        sys.exit(1)
+
+    with PositionStore(sys.argv[2]) as store:
+        if sys.argv[1] == 'compact':
+            minGames = int(sys.argv[3]) if len(sys.argv) > 3 else 0
+            dropped = store.compact(minGames)
+            print('Dropped %d positions.' % dropped)
+        positions, solved, games = store.count()
+        print('%d positions, %d solved, %d simulated games.'
+              % (positions, solved, games))
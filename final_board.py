@@ -8,7 +8,6 @@ This module contains classes that implement the Connect-4 board object.
 '''
 
 # Imports go here...
-from copy import deepcopy
 
 class MoveError(Exception):
     '''
@@ -24,39 +23,148 @@ class BoardError(Exception):
     '''
     pass
 
+class BoardGeometry:
+    '''
+    Instances of this class hold the tables which depend only on the size
+    of a board and on how many pieces in a row are needed to win.  They
+    are computed once per geometry (see getGeometry) and shared by every
+    board of that geometry.
+
+    Cells are numbered row * cols + col.
+    '''
+
+    def __init__(self, rows, cols, k):
+        '''
+        Compute the tables for a geometry.
+
+        Arguments:
+          rows -- the number of rows
+          cols -- the number of columns
+          k    -- the number of pieces in a row needed to win
+        '''
+
+        if rows < 1 or cols < 1:
+            raise BoardError("The board must have at least one row and column.")
+        if k < 1 or k > max(rows, cols):
+            raise BoardError("No line of %d pieces fits on the board." % k)
+        self.rows = rows
+        self.cols = cols
+        self.k = k
+        self.size = rows * cols
+
+        # Every line of k cells on the board, as a tuple of cell numbers.
+        self.lines = []
+        for dr, dc in ((0, 1), (1, 0), (1, 1), (1, -1)):
+            for row in range(rows):
+                for col in range(cols):
+                    endRow = row + dr * (k - 1)
+                    endCol = col + dc * (k - 1)
+                    if 0 <= endRow < rows and 0 <= endCol < cols:
+                        self.lines.append(tuple(
+                            (row + dr * n) * cols + col + dc * n
+                            for n in range(k)))
+            # A single cell is a line in every direction; only count it once.
+            if k == 1:
+                break
+
+        # For each cell, the bit masks of the lines through it, and the
+        # number of such lines (a measure of how useful the cell is).
+        self.winMasks = [[] for cell in range(rows * cols)]
+        for line in self.lines:
+            mask = 0
+            for cell in line:
+                mask |= 1 << cell
+            for cell in line:
+                self.winMasks[cell].append(mask)
+        self.weights = [len(masks) for masks in self.winMasks]
+
+    def __repr__(self):
+        return 'BoardGeometry(%d, %d, %d)' % (self.rows, self.cols, self.k)
+
+    def __reduce__(self):
+        # Unpickle (e.g. in a worker process) to the shared geometry.
+        return (getGeometry, (self.rows, self.cols, self.k))
+
+# Geometries computed so far, keyed by (rows, cols, k).
+_geometries = {}
+
+def getGeometry(rows=6, cols=7, k=4):
+    '''
+    Return the BoardGeometry for the given board size and line length,
+    computing it the first time it is asked for.
+    '''
+
+    key = (rows, cols, k)
+    geometry = _geometries.get(key)
+    if geometry is None:
+        geometry = BoardGeometry(rows, cols, k)
+        _geometries[key] = geometry
+    return geometry
+
 class Connect4Board:
     '''
     Instance of this class manage a Connect-Four board, but do not
-    manage the play of the game itself.
+    manage the play of the game itself.  The board has 6 rows, 7 columns
+    and needs four in a row to win unless another geometry is given.
+
+    Search trees and caches hold very many boards, so boards are kept
+    small: they have no instance dictionary, each cell is stored once as a
+    bit in one of two bit masks (one per player), and the column heights
+    and the moves made share one bytearray, one byte each.  Two boards are
+    equal if they have the same geometry and the same pieces in the same
+    cells, however the pieces got there.
     '''
 
-    def __init__(self):
+    __slots__ = ('geometry', 'moves', 'bits1', 'bits2')
+
+    def __init__(self, rows=6, cols=7, k=4):
         '''
         Initialize the board.
+
+        Arguments:
+          rows -- the number of rows
+          cols -- the number of columns
+          k    -- the number of pieces in a row needed to win
         '''
-        self.board = []
-        for e in range(6):
-            row = []
-            for i in range(7):
-                row.append(0)
-            self.board.append(row)
-        self.rows = 6
-        self.columns = 7
-        self.moves = []
+        if rows > 255 or cols > 128:
+            raise BoardError(
+                "The board can have at most 255 rows and 128 columns.")
+        self.geometry = getGeometry(rows, cols, k)
+        # The number of pieces in column c is moves[c].  After the 'cols'
+        # heights comes one byte per move made: the column, plus 128 for
+        # player 2.
+        self.moves = bytearray(cols)
+        # For each player, a bit mask of the cells holding their pieces.
+        self.bits1 = 0
+        self.bits2 = 0
 
     def getRows(self):
         '''
         Return the number of rows.
         '''
 
-        return self.rows
+        return self.geometry.rows
 
     def getCols(self):
         '''
         Return the number of columns.
         '''
 
-        return self.columns
+        return self.geometry.cols
+
+    def getK(self):
+        '''
+        Return the number of pieces in a row needed to win.
+        '''
+
+        return self.geometry.k
+
+    def getGeometry(self):
+        '''
+        Return the BoardGeometry shared by all boards of this size.
+        '''
+
+        return self.geometry
 
     def get(self, row, col):
         '''
@@ -69,12 +177,54 @@ class Connect4Board:
         Raise a BoardError exception if the 'row' or 'col' value is invalid.
         '''
         
-        if row < 0 or row > 5:
+        if row < 0 or row >= self.geometry.rows:
             raise BoardError("The row value is invalid")
-        if col < 0 or col > 6:
+        if col < 0 or col >= self.geometry.cols:
             raise BoardError("The column value is invalid")
         else:
-            return self.board[row][col]
+            cell = row * self.geometry.cols + col
+            if self.bits1 >> cell & 1:
+                return 1
+            elif self.bits2 >> cell & 1:
+                return 2
+            return 0
+
+    def getHeight(self, col):
+        '''
+        Arguments:
+          col -- a valid column index
+
+        Return value: the number of pieces in column 'col'.
+        '''
+
+        return self.moves[col]
+
+    def getMoves(self):
+        '''
+        Return the moves made so far, oldest first, as a list of
+        (player, col) tuples.
+        '''
+
+        return [(1 + (move >> 7), move & 0x7f)
+                for move in self.moves[self.geometry.cols:]]
+
+    def moveCount(self):
+        '''
+        Return the number of moves made so far.
+        '''
+
+        return len(self.moves) - self.geometry.cols
+
+    def lastMove(self):
+        '''
+        Return the column of the most recent move.
+
+        Raise a MoveError exception if no move has been made.
+        '''
+
+        if len(self.moves) == self.geometry.cols:
+            raise MoveError("No move has been made.")
+        return self.moves[-1] & 0x7f
 
     def clone(self):
         '''
@@ -85,7 +235,37 @@ class Connect4Board:
         Return value: the new Connect4Board instance.
         '''
 
-        return deepcopy(self)
+        copy = Connect4Board.__new__(Connect4Board)
+        # The geometry is never changed, so it can be shared.
+        copy.geometry = self.geometry
+        copy.moves = bytearray(self.moves)
+        copy.bits1 = self.bits1
+        copy.bits2 = self.bits2
+        return copy
+
+    def __eq__(self, other):
+        if not isinstance(other, Connect4Board):
+            return NotImplemented
+        return (self.geometry is other.geometry and self.bits1 == other.bits1
+                and self.bits2 == other.bits2)
+
+    def __hash__(self):
+        # Boards are mutable: a board must not be changed while it is a
+        # key in a dictionary or a member of a set.
+        return hash((self.geometry.rows, self.geometry.cols, self.geometry.k,
+                     self.bits1, self.bits2))
+
+    def key(self):
+        '''
+        Return a compact key for the position on the board, as bytes: the
+        geometry, then two bits per cell.  Like equality, the key does not
+        depend on the order the moves were made in.
+        '''
+
+        geometry = self.geometry
+        cells = self.bits1 | self.bits2 << geometry.size
+        return (bytes((geometry.rows, geometry.cols, geometry.k)) +
+                cells.to_bytes((2 * geometry.size + 7) // 8, 'little'))
 
     def possibleMoves(self):
         '''
@@ -94,14 +274,29 @@ class Connect4Board:
 
         Return value: the list of possible moves
         '''
+        rows = self.geometry.rows
         open_columns = []
-        for column in range(7):
-            # Check the top row to determine if a piece can be played in a 
-            # given column. If this row is empty, the column is available.
-            if self.board[5][column] == 0:
+        for column in range(self.geometry.cols):
+            # A piece can be played in a column which is not full.
+            if self.moves[column] < rows:
                 open_columns.append(column)
         return open_columns
 
+    def possibleMovesMask(self):
+        '''
+        Compute the possible moves as a bit mask, with bit 'col' set for
+        each column which is not completely filled up.
+
+        Return value: the bit mask of possible moves
+        '''
+
+        rows = self.geometry.rows
+        mask = 0
+        for column in range(self.geometry.cols):
+            if self.moves[column] < rows:
+                mask |= 1 << column
+        return mask
+
     def makeMove(self, col, player):
         '''
         Make a move on the specified column for the specified player.
@@ -116,22 +311,23 @@ class Connect4Board:
         is filled up, or if the column index or player number is invalid.
         '''
 
+        geometry = self.geometry
         if player != 1 and player != 2:
             raise MoveError("There are only two players, 1 and 2.")        
-        if col < 0 or col > self.columns :
+        if col < 0 or col >= geometry.cols:
             raise MoveError("This is an invalid column value.")
-        moves = self.possibleMoves() 
-        if col not in moves:
+        row = self.moves[col]
+        if row == geometry.rows:
             raise MoveError("That column is full.")
         
-        # Find the highest open row in the given column and place piece.
-        for row in range(0, 6):
-            if self.get(row, col) == 0:
-                self.board[row][col] = player
-                self.moves.append((row, col))
-                break
-            
-                
+        # Place the piece on top of the column.
+        cell = row * geometry.cols + col
+        self.moves[col] = row + 1
+        if player == 1:
+            self.bits1 |= 1 << cell
+        else:
+            self.bits2 |= 1 << cell
+        self.moves.append(col | (player - 1) << 7)
 
     def unmakeMove(self, col):
         '''
@@ -146,164 +342,34 @@ class Connect4Board:
         column index is invalid.
         '''
 
-        if col < 0 or col > 6:
+        geometry = self.geometry
+        if col < 0 or col >= geometry.cols:
             raise MoveError("This is an invalid column value.")
-        if self.board[0][col] == 0:
+        row = self.moves[col] - 1
+        if row < 0:
             raise MoveError("You cannot undo a move from an empty column.")
 
-        # Find the highest piece in the given column and remove it.
-        for row in range(5, -1, -1):
-            if self.board[row][col] != 0:
-                self.board[row][col] = 0
-                break
-
-        # Remove the most recent move.
-        self.moves.pop()
-            
-    def vertWin(self, col):
-        '''This method checks to see if a win has been achieved in the vertical
-        direction.'''
-
-        # A win would only come from the last move. 
-        last = self.moves[-1]
-        row = last[0]
-
-        # A vertical win would require a piece to be in the 4th highest row.
-        if row >= 3:
-            # Check if the last four pieces placed in the given column
-            # are from the same team.
-            for n in range(1,4):
-                if self.get(row - n, col) != self.get(row, col):
-                    # Any difference in this set of 4 would not result 
-                    # in a win.
-                    return False
-            # 4 consecutive vertical pieces from the same team results
-            # in a win.
-            return True
+        # Remove the highest piece in the given column.
+        cell = row * geometry.cols + col
+        self.moves[col] = row
+        if self.bits1 >> cell & 1:
+            player = 1
+            self.bits1 &= ~(1 << cell)
         else:
-            return False
-   
-    def horizWin(self, col):
-        '''This method checks to see if a win has been achieved in the 
-        horizontal direction.'''
-
-        # A win could only result from the most recent move.
-        last = self.moves[-1]
-        row = last[0]
-        value = self.get(row, col)
-        columns = 0
-
-        # Find how many consecutive columns to the right of the given 
-        # column have the same value (are from the same team). Return 
-        # a win if there are 3 (the fourth is given).   
-        for n in range (1, 4):
-            if col + n < 7:
-                if self.get(row, col + n) == value:
-                    columns += 1
-                    if columns == 3:
-                        return True
-                else: 
-                    break
-            else:
-                break
-        
-        # Keep adding to the column total by checking the columns
-        # to the left of the given column. If they have the same 
-        # value as the given column, increment the columns counter.
-        # Return a win if there are 3 (the fourth is given).
-        for n in range(1, 4):
-            if col - n >= 0:
-                if self.get(row, col - n) == value:
-                    columns += 1
-                    if columns == 3:
-                        return True
-                else: 
-                    break
-            else:
-                break
-        
-        
-        
-    def diagWin(self,col):
-        '''This helper function checks to see if four same-colored tiles were
-        placed consecutively along a diagonal.'''
-
-        # A win could only have resulted from the last move.
-        last = self.moves[-1]
-        row = last[0]
-        value = self.get(row, col)
-        pieces = 0
-
-        # See how many consecutive pieces going from bottom left to the top 
-        # right are of the same value as the last played piece.
-        for n in range(1, 4):
-            new_row = row + n
-            new_col = col + n            
-            if new_row <= self.rows - 1 and new_col <= self.columns - 1:
-                if self.get(new_row, new_col) == value:
-                    pieces += 1
-                else: 
-                    break
-            else:
-                break
-        for n in range(1, 4):
-            new_row = row - n
-            new_col = col - n            
-            if new_row >= 0 and new_col >= 0:
-                if self.get(new_row, new_col) == value:
-                    pieces += 1
-                else: 
-                    break
-            else: 
-                break
-
-        # If at least 3 other pieces are found of the same value
-        # in this diagonal direction, then return true. Otherwise,
-        # reset the piece counter and check for a diagonal win 
-        # in the other direction (top left to bottom right).
-        if pieces >= 3:
-            return True
-        tiles = 0
-        for n in range(1, 4):
-            new_row = row + n
-            new_col = col - n
-            if new_row <=  self.rows - 1 and new_col >= 0:
-                if self.get(new_row, new_col) == value:
-                    tiles += 1
-                else:
-                    break
-            else:
-                break
-        for n in range(1, 4):
-            new_row = row - n
-            new_col = col + n
-            if new_row >= 0 and new_col <= self.columns - 1:
-                if self.get(new_row, new_col) == value:
-                    tiles += 1
-                else: 
-                    break
-            else:
-                break
+            player = 2
+            self.bits2 &= ~(1 << cell)
 
-        # If at least 3 other pieces are found of the same value
-        # in this diagonal direction, then return true. Otherwise,
-        # return false as no diagonal win has been found.
-        if tiles >= 3:
-            return True
+        # Remove the most recent move in that column from the moves made.
+        move = col | (player - 1) << 7
+        if self.moves[-1] == move:
+            del self.moves[-1]
         else:
-            return False
-        
-            
-            
-             
-        
-                
-        
+            del self.moves[self.moves.rindex(move, geometry.cols)]
 
     def isWin(self, col):
         '''
         Check to see if the last move played in column 'col' resulted in a win
-        (four or more discs of the same color in a row in any direction).
+        (k or more discs of the same color in a row in any direction).
 
         Argument: 
           col    -- a valid column index
@@ -314,16 +380,20 @@ class Connect4Board:
         ever been made in the column), or if the column index is invalid.
         '''
 
-        if col < 0 or col > 6 :
+        geometry = self.geometry
+        if col < 0 or col >= geometry.cols:
             raise MoveError("This is an invalid column value.")
-        if self.board[0][col] == 0:
+        row = self.moves[col] - 1
+        if row < 0:
             raise MoveError("This column is empty")
-        if self.vertWin(col) == True:
-            return True
-        if self.horizWin(col) == True:
-            return True 
-        if self.diagWin(col) == True:
-            return True
+
+        # A win must use the top piece of the column, so only the lines
+        # through that cell need to be checked.
+        cell = row * geometry.cols + col
+        bits = self.bits1 if self.bits1 >> cell & 1 else self.bits2
+        for mask in geometry.winMasks[cell]:
+            if bits & mask == mask:
+                return True
         return False
 
     def isDraw(self):
@@ -336,7 +406,7 @@ class Connect4Board:
         Return value: True if there is a draw, else False
         '''
 
-        if self.possibleMoves() == []:
+        if len(self.moves) == self.geometry.size + self.geometry.cols:
             return True
         return False
 
@@ -354,12 +424,14 @@ class Connect4Board:
         Precondition: This assumes that the move can be made.
         '''
 
-        # Make the move on a copy of the board and see if it results
-        # in a win.
-        copy = self.clone()
-        copy.makeMove(col, player)
-        if copy.isWin(col) == True:
-            return True
+        # See if the cell the piece would land in completes a line,
+        # without touching the board.
+        geometry = self.geometry
+        cell = self.moves[col] * geometry.cols + col
+        bits = (self.bits1 if player == 1 else self.bits2) | (1 << cell)
+        for mask in geometry.winMasks[cell]:
+            if bits & mask == mask:
+                return True
         return False
 
     def isDrawingMove(self, col, player):
@@ -377,10 +449,7 @@ class Connect4Board:
         move has been checked to see that it does not result in a win.
         '''
         
-        # Make the move on a copy of the board and see if it results 
-        # in a draw.
-        copy = self.clone()
-        copy.makeMove(col, player)
-        if copy.isDraw() == True:
+        # The move is a draw if it fills the last empty cell.
+        if len(self.moves) == self.geometry.size + self.geometry.cols - 1:
             return True
         return False
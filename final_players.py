@@ -8,8 +8,9 @@ This module contains code for various bots that play Connect4 at varying
 degrees of sophistication.
 '''
 
-import random
 from Connect4Simulator import *
+from Connect4Search import search, parallelSearch, TranspositionTable
+from Connect4Random import RandomStream
 # Any other imports go here...
 
 
@@ -19,6 +20,17 @@ class RandomPlayer:
     chosen at random.
     '''
 
+    def __init__(self, rng=None):
+        '''
+        Initialize the player.
+
+        Arguments:
+          rng -- the RandomStream to choose moves with; a stream with a
+                 random seed is used if None
+        '''
+
+        self.rng = rng if rng is not None else RandomStream()
+
     def chooseMove(self, board, player):
         '''
         Given the current board and player number, choose and return a move.
@@ -31,11 +43,11 @@ class RandomPlayer:
         Invariant: The board state does not change.
         '''
 
-        # Gather a list of the possible moves and pick one randomly.
+        # Pick one of the possible moves randomly.
         assert player in [1, 2]
-        possible_moves = board.possibleMoves()
-        assert possible_moves != []
-        return random.choice(possible_moves)
+        mask = board.possibleMovesMask()
+        assert mask != 0
+        return self.rng.choiceMask(mask)
 
 
 class SimplePlayer:
@@ -44,6 +56,17 @@ class SimplePlayer:
     Otherwise, it picks a random legal move.
     '''
 
+    def __init__(self, rng=None):
+        '''
+        Initialize the player.
+
+        Arguments:
+          rng -- the RandomStream to choose moves with; a stream with a
+                 random seed is used if None
+        '''
+
+        self.rng = rng if rng is not None else RandomStream()
+
     def chooseMove(self, board, player):
         '''
         Given the current board and player number, choose and return a move.
@@ -57,20 +80,18 @@ class SimplePlayer:
         '''
         
         # Get the possible moves, and see if any of them would 
-        # result in a win. 
+        # result in a win.  This is called at every ply of every
+        # simulated game, so it works on the mask of possible moves
+        # and never copies the board.
         assert player in [1, 2]
-        possible_moves = board.possibleMoves()
-        assert possible_moves != []
-        for column in possible_moves:
-            # Create a copy of the board to try each move 
-            # without changing board state.
-            copy = board.clone()
-            copy.makeMove(column, player)
+        mask = board.possibleMovesMask()
+        assert mask != 0
+        for column in range(board.getCols()):
             # If a move would yield a win, take that move.
-            if copy.isWin(column) == True:
+            if mask >> column & 1 and board.isWinningMove(column, player):
                 return column 
         # If no moves yield a win, then pick a random move.
-        return random.choice(possible_moves)
+        return self.rng.choiceMask(mask)
 
 
 class BetterPlayer:
@@ -81,6 +102,17 @@ class BetterPlayer:
     If there is no such move, it picks a random move.
     '''
 
+    def __init__(self, rng=None):
+        '''
+        Initialize the player.
+
+        Arguments:
+          rng -- the RandomStream to choose moves with; a stream with a
+                 random seed is used if None
+        '''
+
+        self.rng = rng if rng is not None else RandomStream()
+
     def chooseMove(self, board, player):
         '''
         Given the current board and player number, choose and return a move.
@@ -129,7 +161,7 @@ class BetterPlayer:
         # If all moves allow the opponent a chance to win, 
         # pick a random one.
         if opponent_winners == possible_moves:
-            return random.choice(possible_moves)
+            return self.rng.choice(possible_moves)
         # Otherwise, get a list of the moves that don't 
         # allow the opponent to win, and choose a random 
         # move from that list.
@@ -138,7 +170,7 @@ class BetterPlayer:
             for move in possible_moves:
                 if move not in opponent_winners:
                     opponent_blockers.append(move)
-            return random.choice(opponent_blockers)
+            return self.rng.choice(opponent_blockers)
 
                 
             
@@ -154,18 +186,26 @@ class Monty:
     picking the one that has the highest probability of success.
     '''
 
-    def __init__(self, n, player):
+    def __init__(self, n, player, rng=None, store=None):
         '''
         Initialize the player using a simpler computer player.
 
         Arguments: 
           n      -- number of games to simulate.
           player -- the computer player
+          rng    -- the RandomStream used by the simulated games; a stream
+                    with a random seed is used if None
+          store  -- an optional PositionStore; games recorded there are
+                    reused, and new games are added to it
         '''
 
         assert n > 0
         self.player = player
         self.n = n
+        self.rng = rng if rng is not None else RandomStream()
+        self.store = store
+        # Both sides of every simulated game are played by this player.
+        self.simPlayer = SimplePlayer(self.rng)
 
     def chooseMove(self, board, player):
         '''
@@ -188,33 +228,82 @@ class Monty:
             opponent = 1
         possible_moves = board.possibleMoves()
         top_move = possible_moves[0]
-        # For each possible move, make the move on a copy of the board.
+        # If a move would yield a win, take that move.
         for move in possible_moves:
-            copy = board.clone()
-            copy.makeMove(move, player)
-            # If a move would yield a win, take that move.
-            if copy.isWin(move) == True:
+            if board.isWinningMove(move, player):
                 return move
-            # Otherwise, initialize the number of wins to 0 and 
-            # simulate the number of games that were already 
-            # defined using simple players on both sides.
-            else:
-                wins = 0
-                for n in range(self.n):
-                    copy2 = copy.clone()
-                    sim = Connect4Simulator(copy2, SimplePlayer(),
-                                            SimplePlayer(), opponent)                    
-                    result = sim.simulate()
-                    # Keep track of how many simulated wins the player has
-                    # after making the current move.
-                    if result == player:
-                        wins += 1
-                # If this move yielded more simulated wins than what was 
-                # previously the best, set it as the top move, and keep 
-                # track of how many wins it had.
-                if wins > best:
-                    best = wins
-                    top_move = move
+        # Otherwise, for each possible move, make the move and simulate
+        # the number of games that were already defined using simple
+        # players on both sides.  The games are played on the board
+        # itself and undone afterwards, so nothing is copied.
+        sim = Connect4Simulator(board, self.simPlayer, self.simPlayer,
+                                opponent)
+        for move in possible_moves:
+            board.makeMove(move, player)
+            try:
+                # Only simulate the games the store does not already have.
+                results = [0, 0, 0]
+                if self.store is not None:
+                    results = self.store.getRollouts(board, opponent)
+                needed = self.n - sum(results)
+                if needed > 0:
+                    new_results = sim.simulate_many(needed)
+                    if self.store is not None:
+                        self.store.addRollouts(board, opponent, new_results)
+                    for i in range(3):
+                        results[i] += new_results[i]
+            finally:
+                board.unmakeMove(move)
+            # Keep track of the fraction of simulated games the player
+            # wins after making the current move.
+            wins = results[player] / sum(results)
+            # If this move yielded more simulated wins than what was 
+            # previously the best, set it as the top move, and keep 
+            # track of how many wins it had.
+            if wins > best:
+                best = wins
+                top_move = move
         # Return the top move that won the most simulated games.
         return top_move
 
+
+class SearchPlayer:
+    '''
+    This player searches the game tree to a fixed depth with alpha-beta
+    search, optionally using several worker processes at once.
+    '''
+
+    def __init__(self, depth, workers=1):
+        '''
+        Initialize the player.
+
+        Arguments:
+          depth   -- the number of moves to look ahead
+          workers -- the number of worker processes to search with
+        '''
+
+        assert depth > 0
+        assert workers > 0
+        self.depth = depth
+        self.workers = workers
+        # A serial search keeps one table, private to this process, for
+        # the whole game.
+        self.table = TranspositionTable(shared=False) if workers == 1 else None
+
+    def chooseMove(self, board, player):
+        '''
+        Given the current board and player number, choose and return a move.
+
+        Arguments:
+          board  -- a Connect4Board instance
+          player -- either 1 or 2
+
+        Precondition: There must be at least one legal move.
+        Invariant: The board state does not change.
+        '''
+
+        if self.workers == 1:
+            result = search(board, player, self.depth, self.table)
+        else:
+            result = parallelSearch(board, player, self.depth, self.workers)
+        return result.move
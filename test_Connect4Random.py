@@ -0,0 +1,80 @@
+'''
+test_Connect4Random.py
+
+This module checks that the seeded random streams, and the simulations and
+players built on them, can be reproduced exactly.  Run it with
+"python -m unittest test_Connect4Random".
+'''
+
+import unittest
+
+import Connect4Random
+from final_board import Connect4Board
+from final_players import Monty
+from Connect4Random import RandomStream
+from Connect4Simulator import Connect4Simulator
+
+
+def draw(stream, count=2000):
+    '''
+    Return a list of 'count' choices of each kind from a stream.
+    '''
+
+    masks = [0b1111111, 0b1010110, 0b1000000, 0b0000101]
+    seq = 'abcdefg'
+    return ([stream.choiceMask(masks[i % len(masks)]) for i in range(count)]
+            + [stream.choice(seq) for i in range(count)])
+
+
+class RandomStreamTest(unittest.TestCase):
+
+    def test_same_seed_same_sequence(self):
+        for worker in (0, 3):
+            self.assertEqual(draw(RandomStream(42, worker)),
+                             draw(RandomStream(42, worker)))
+        # Small blocks are refilled often, which must not change anything.
+        self.assertEqual(draw(RandomStream(42, blockSize=3)),
+                         draw(RandomStream(42)))
+
+    @unittest.skipIf(Connect4Random.numpy is None, 'NumPy is not installed')
+    def test_same_seed_same_sequence_numpy(self):
+        self.assertEqual(draw(RandomStream(42, 1, 'numpy')),
+                         draw(RandomStream(42, 1, 'numpy')))
+
+    def test_spawned_streams_differ(self):
+        stream = RandomStream(42)
+        sequences = [draw(stream.spawn(worker)) for worker in range(4)]
+        for i in range(len(sequences)):
+            for j in range(i):
+                self.assertNotEqual(sequences[i], sequences[j])
+        self.assertEqual(draw(stream.spawn(2)), draw(RandomStream(42, 2)))
+        self.assertNotEqual(draw(RandomStream(43)), draw(RandomStream(42)))
+
+    def test_choice_mask_set_bits(self):
+        stream = RandomStream(7)
+        for mask in (1, 0b1000000, 0b1010110, 0b1111111, (1 << 31) | 1):
+            seen = set(stream.choiceMask(mask) for i in range(500))
+            bits = set(i for i in range(mask.bit_length()) if mask >> i & 1)
+            self.assertEqual(seen, bits)
+
+    def test_simulations_reproducible(self):
+        board = Connect4Board()
+        results = [Connect4Simulator(board, None, None, 1,
+                                     RandomStream(5)).simulate_many(300)
+                   for i in range(2)]
+        self.assertEqual(results[0], results[1])
+        self.assertEqual(board.moveCount(), 0)
+
+    def test_monty_reproducible(self):
+        board = Connect4Board()
+        for col, player in [(3, 1), (3, 2), (2, 1)]:
+            board.makeMove(col, player)
+        before = board.getMoves()
+        moves = [Monty(40, 2, RandomStream(11)).chooseMove(board, 2)
+                 for i in range(2)]
+        self.assertEqual(moves[0], moves[1])
+        self.assertEqual(board.getMoves(), before)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,138 @@
+'''
+test_Connect4Search.py
+
+This module checks the transposition table and the parallel search: the
+packing of table entries, shared memory handling, and how the results and
+failures of worker processes reach the parent.  Run it with
+"python -m unittest test_Connect4Search".
+'''
+
+import multiprocessing
+import os
+import unittest
+
+import Connect4Search
+from final_board import Connect4Board
+from Connect4Search import (TranspositionTable, SearchWorkerError, search,
+                            parallelSearch, EXACT, LOWER, UPPER, WIN_SCORE)
+
+
+def forcedWin():
+    '''
+    Return a board on which player 1, to move, wins at once in column 3
+    (the bottom row holds 1 1 1 . with player 2 stacked on top).
+    '''
+
+    board = Connect4Board()
+    for col in range(3):
+        board.makeMove(col, 1)
+        board.makeMove(col, 2)
+    return board
+
+
+def _exitAtOnce(self, board, player, depth):
+    # Replaces Searcher.search in forked workers: dies without a result.
+    os._exit(3)
+
+
+class TranspositionTableTest(unittest.TestCase):
+
+    def roundTrip(self, table):
+        entries = [(0, 0, 0, EXACT, -1),
+                   ((1 << 64) - 1, 0x7fff, 0xff, UPPER, 254),
+                   (12345, -0x8000, 300, LOWER, 0),
+                   (7, -WIN_SCORE, 1, UPPER, 6)]
+        for key, score, depth, flag, move in entries:
+            table.store(key, score, depth, flag, move)
+            # Depths are stored in 8 bits, and deeper ones saturate.
+            self.assertEqual(table.probe(key),
+                             (score, min(depth, 0xff), flag, move))
+        # A key which maps to the same slot but differs is rejected.
+        table.store(5, 1, 2, EXACT, 3)
+        self.assertIsNone(table.probe(5 + table.size))
+
+    def test_round_trip_private(self):
+        self.roundTrip(TranspositionTable(101, shared=False))
+
+    def test_round_trip_shared(self):
+        table = TranspositionTable(101)
+        try:
+            self.roundTrip(table)
+        finally:
+            table.close()
+
+    def test_attach(self):
+        table = TranspositionTable(101)
+        try:
+            table.store(42, 17, 5, LOWER, 2)
+            other = TranspositionTable(101, table.getName())
+            self.assertEqual(other.probe(42), (17, 5, LOWER, 2))
+            other.store(43, -9, 4, UPPER, 1)
+            other.close()
+            self.assertEqual(table.probe(43), (-9, 4, UPPER, 1))
+        finally:
+            table.close()
+
+    def test_clear_rounded_block(self):
+        # Some platforms round a block up to whole pages, so the block may
+        # hold more words than the table uses.  Attaching to a larger block
+        # gives that case everywhere.
+        owner = TranspositionTable(1000)
+        try:
+            table = TranspositionTable(100, owner.getName())
+            self.assertGreater(len(table.slots), 2 * table.size)
+            for key in range(0, 1000, 3):
+                table.store(key, key, 3, EXACT, key % 7)
+            table.clear()
+            self.assertFalse(any(table.slots[:2 * table.size]))
+            self.assertIsNone(table.probe(3))
+            table.close()
+        finally:
+            owner.close()
+
+    def test_close_unlinks(self):
+        table = TranspositionTable(100)
+        name = table.getName()
+        table.close()
+        with self.assertRaises(FileNotFoundError):
+            TranspositionTable(100, name)
+
+
+class ParallelSearchTest(unittest.TestCase):
+
+    def test_forced_win(self):
+        board = forcedWin()
+        before = board.getMoves()
+        serial = search(board, 1, 4)
+        parallel = parallelSearch(board, 1, 4, workers=2)
+        self.assertEqual(serial.move, 3)
+        self.assertEqual((parallel.move, parallel.score),
+                         (serial.move, serial.score))
+        self.assertEqual(len(parallel.nodes), 2)
+        self.assertEqual(board.getMoves(), before)
+
+    def test_worker_exception(self):
+        # Searching a full board fails an assertion in every worker.
+        board = Connect4Board(2, 2, 2)
+        for col, player in [(0, 1), (1, 2), (0, 2), (1, 1)]:
+            board.makeMove(col, player)
+        with self.assertRaises(AssertionError) as context:
+            parallelSearch(board, 1, 4, workers=2)
+        self.assertIsInstance(context.exception.__cause__, SearchWorkerError)
+        self.assertIn('Traceback', str(context.exception.__cause__))
+
+    @unittest.skipUnless(multiprocessing.get_start_method() == 'fork',
+                         'needs forked workers to replace the search')
+    def test_dead_worker(self):
+        original = Connect4Search.Searcher.search
+        Connect4Search.Searcher.search = _exitAtOnce
+        try:
+            with self.assertRaises(SearchWorkerError) as context:
+                parallelSearch(Connect4Board(), 1, 4, workers=2)
+        finally:
+            Connect4Search.Searcher.search = original
+        self.assertIn('exited with code 3', str(context.exception))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,176 @@
+'''
+test_Connect4Solver.py
+
+This module checks the solver against an exhaustive search on boards small
+enough to search completely, and on positions near the end of games on
+the standard board, and checks that the corpus runner answers positions
+from an opening book.  Run it with "python -m unittest test_Connect4Solver".
+'''
+
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from final_board import Connect4Board
+from Connect4Solver import Solver, solve
+
+
+class ExhaustiveSearch:
+    '''
+    Instances of this class find the exact score of a position, as defined
+    by the solver, by searching every continuation of the game.
+    '''
+
+    def __init__(self, cells):
+        self.cells = cells
+        self.scores = {}
+
+    def score(self, board, player):
+        '''
+        Return the exact score of a position for the player to move.
+        '''
+
+        key = (board.key(), player)
+        if key not in self.scores:
+            self.scores[key] = self.search(board, player)
+        return self.scores[key]
+
+    def search(self, board, player):
+        moves = board.moveCount()
+        for col in board.possibleMoves():
+            if board.isWinningMove(col, player):
+                return (self.cells + 1 - moves) // 2
+        best = None
+        for col in board.possibleMoves():
+            if moves + 1 == self.cells:
+                score = 0
+            else:
+                board.makeMove(col, player)
+                score = -self.score(board, 3 - player)
+                board.unmakeMove(col)
+            if best is None or score > best:
+                best = score
+        return best
+
+
+def randomPosition(rows, cols, k, moves, rng):
+    '''
+    Return a tuple (board, player to move) reached by playing 'moves'
+    random moves without either player winning.
+    '''
+
+    while True:
+        board = Connect4Board(rows, cols, k)
+        player = 1
+        for i in range(moves):
+            col = rng.choice(board.possibleMoves())
+            if board.isWinningMove(col, player):
+                break
+            board.makeMove(col, player)
+            player = 3 - player
+        else:
+            return board, player
+
+
+class SolverTest(unittest.TestCase):
+
+    # (rows, cols, k, moves played before the position, positions)
+    cases = [(3, 4, 3, 0, 1),
+             (4, 4, 3, 0, 1),
+             (4, 4, 3, 3, 10),
+             (4, 5, 4, 8, 10),
+             (5, 5, 4, 12, 5),
+             (6, 7, 4, 28, 10)]
+
+    def checkCase(self, rows, cols, k, played, count):
+        rng = random.Random(rows * 100 + cols * 10 + played)
+        solver = Solver(rows, cols, k, tableSize=100003)
+        search = ExhaustiveSearch(rows * cols)
+        for i in range(count):
+            board, player = randomPosition(rows, cols, k, played, rng)
+            before = board.getMoves()
+            expected = search.score(board, player)
+            result = solver.solve(board, player)
+            self.assertEqual(result.score, expected, before)
+            self.assertEqual(result.distance,
+                             solver.distance(expected, board.moveCount()))
+            weak = solver.solve(board, player, weak=True)
+            self.assertEqual(weak.score, (expected > 0) - (expected < 0))
+            self.assertIsNone(weak.distance)
+            scores = solver.analyze(board, player)
+            self.assertEqual(max(s for s in scores if s is not None),
+                             expected)
+            self.assertEqual(board.getMoves(), before)
+
+    def test_exhaustive(self):
+        for case in self.cases:
+            with self.subTest(case=case):
+                self.checkCase(*case)
+
+    def test_winning_cells(self):
+        # Compare with the lines of the board's geometry, for the written
+        # out k = 4 case and the general one.
+        rng = random.Random(4)
+        for rows, cols, k in [(6, 7, 4), (5, 6, 4), (6, 7, 5), (5, 6, 3)]:
+            solver = Solver(rows, cols, k, tableSize=1)
+            lines = Connect4Board(rows, cols, k).getGeometry().lines
+            for i in range(30):
+                board = Connect4Board(rows, cols, k)
+                for j in range(rng.randrange(rows * cols)):
+                    board.makeMove(rng.choice(board.possibleMoves()),
+                                   rng.choice((1, 2)))
+                position, mask = solver.fromBoard(board, 1)
+                expected = 0
+                for line in lines:
+                    empty = [cell for cell in line
+                             if board.get(cell // cols, cell % cols) != 1]
+                    if len(empty) == 1:
+                        row, col = divmod(empty[0], cols)
+                        if board.get(row, col) == 0:
+                            expected |= 1 << (col * (rows + 1) + row)
+                self.assertEqual(solver.winningCells(position, mask),
+                                 expected)
+
+    def test_reset(self):
+        board = Connect4Board(4, 4, 3)
+        solver = Solver(4, 4, 3, tableSize=1009)
+        first = solver.solve(board, 1)
+        self.assertTrue(any(solver.values))
+        solver.reset()
+        self.assertFalse(any(solver.values))
+        self.assertEqual(solver.solve(board, 1).nodes, first.nodes)
+
+    def test_module_solve(self):
+        board = Connect4Board(4, 4, 3)
+        expected = ExhaustiveSearch(16).score(board, 1)
+        self.assertEqual(solve(board, 1).score, expected)
+
+    def test_book(self):
+        # Load a book through the corpus runner, then run a corpus with it.
+        board, player = randomPosition(6, 7, 4, 30, random.Random(30))
+        moves = ''.join(str(col + 1) for mover, col in board.getMoves())
+        expected = Solver(tableSize=100003).solve(board, player)
+        runner = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                              'Connect4Solver.py')
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'book.db')
+            subprocess.run([sys.executable, runner, '--book', path],
+                           input='%s %d\n' % (moves, expected.score),
+                           text=True, check=True)
+            output = subprocess.run([sys.executable, runner, path],
+                                    input=moves + '\n', text=True,
+                                    check=True, capture_output=True).stdout
+        finally:
+            shutil.rmtree(directory)
+        self.assertEqual(output.split(),
+                         [moves, str(expected.score),
+                          str(expected.distance), '0', '0'])
+
+
+if __name__ == '__main__':
+    unittest.main()
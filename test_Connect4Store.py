@@ -0,0 +1,147 @@
+'''
+test_Connect4Store.py
+
+This module checks the persistent position store: buffered and flushed
+reads and writes, accumulation of rollout counts, compaction, several
+processes writing at once, and its use by the solver.  Run it with
+"python -m unittest test_Connect4Store".
+'''
+
+import multiprocessing
+import os
+import shutil
+import tempfile
+import unittest
+
+from final_board import Connect4Board
+from Connect4Solver import Solver
+from Connect4Store import PositionStore
+
+
+def position(moves, rows=6, cols=7, k=4):
+    '''
+    Return a tuple (board, player to move) after a sequence of moves.
+    '''
+
+    board = Connect4Board(rows, cols, k)
+    player = 1
+    for col in moves:
+        board.makeMove(col, player)
+        player = 3 - player
+    return board, player
+
+
+def _writer(path, games):
+    # Run in a separate process: add rollouts for a few positions.
+    with PositionStore(path, batchSize=7) as store:
+        for i in range(games):
+            board, player = position([i % 3])
+            store.addRollouts(board, player, [1, 2, 3])
+
+
+class PositionStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'positions.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_visible_before_and_after_flush(self):
+        board, player = position([3, 3, 2])
+        with PositionStore(self.path) as store:
+            self.assertIsNone(store.getSolved(board, player))
+            self.assertEqual(store.getRollouts(board, player), [0, 0, 0])
+            store.putSolved(board, player, 5, 17)
+            store.addRollouts(board, player, [1, 4, 2])
+            self.assertEqual(store.getSolved(board, player), (5, 17))
+            self.assertEqual(store.getRollouts(board, player), [1, 4, 2])
+            store.flush()
+            self.assertEqual(store.getSolved(board, player), (5, 17))
+            self.assertEqual(store.getRollouts(board, player), [1, 4, 2])
+            # The other player to move is a different position.
+            self.assertIsNone(store.getSolved(board, 3 - player))
+
+    def test_reopen(self):
+        with PositionStore(self.path) as store:
+            for col in range(7):
+                board, player = position([col])
+                store.putSolved(board, player, -col, col)
+                store.addRollouts(board, player, [0, col, 1])
+        with PositionStore(self.path) as store:
+            self.assertEqual(store.count(), (7, 7, 28))
+            board, player = position([4])
+            self.assertEqual(store.getSolved(board, player), (-4, 4))
+            self.assertEqual(store.getRollouts(board, player), [0, 4, 1])
+
+    def test_rollouts_accumulate(self):
+        board, player = position([3])
+        with PositionStore(self.path) as store:
+            store.addRollouts(board, player, [1, 2, 3])
+            store.flush()
+            store.addRollouts(board, player, [1, 0, 5])
+            self.assertEqual(store.getRollouts(board, player), [2, 2, 8])
+            store.flush()
+            store.addRollouts(board, player, [0, 1, 0])
+            store.putSolved(board, player, 2, 9)
+        with PositionStore(self.path) as store:
+            self.assertEqual(store.getRollouts(board, player), [2, 3, 8])
+            self.assertEqual(store.count(), (1, 1, 13))
+
+    def test_compact(self):
+        solvedThin, player = position([0])
+        unsolvedThin, player = position([1])
+        unsolvedThick, player = position([2])
+        with PositionStore(self.path) as store:
+            store.putSolved(solvedThin, player, 1, 3)
+            store.addRollouts(solvedThin, player, [1, 1, 1])
+            store.addRollouts(unsolvedThin, player, [1, 1, 1])
+            store.addRollouts(unsolvedThick, player, [5, 5, 5])
+            self.assertEqual(store.compact(10), 1)
+            self.assertEqual(store.count(), (2, 1, 15))
+            self.assertEqual(store.getSolved(solvedThin, player), (1, 3))
+            self.assertEqual(store.getRollouts(solvedThin, player),
+                             [0, 0, 0])
+            self.assertEqual(store.getRollouts(unsolvedThin, player),
+                             [0, 0, 0])
+            self.assertEqual(store.getRollouts(unsolvedThick, player),
+                             [5, 5, 5])
+
+    def test_concurrent_writers(self):
+        PositionStore(self.path).close()
+        procs = [multiprocessing.Process(target=_writer,
+                                         args=(self.path, 30))
+                 for i in range(4)]
+        for proc in procs:
+            proc.start()
+        for proc in procs:
+            proc.join()
+            self.assertEqual(proc.exitcode, 0)
+        with PositionStore(self.path) as store:
+            # 4 writers x 30 games, spread over 3 positions.
+            self.assertEqual(store.count(), (3, 0, 4 * 30 * 6))
+            board, player = position([0])
+            self.assertEqual(store.getRollouts(board, player),
+                             [40, 80, 120])
+
+    def test_solver_uses_store(self):
+        board, player = position([2, 1, 2, 3], 4, 5, 4)
+        with PositionStore(self.path) as store:
+            solver = Solver(4, 5, 4, tableSize=100003, store=store)
+            first = solver.solve(board, player)
+            self.assertGreater(first.nodes, 0)
+            second = solver.solve(board, player)
+            self.assertEqual(second.nodes, 0)
+            self.assertEqual((second.score, second.distance),
+                             (first.score, first.distance))
+            weak = solver.solve(board, player, weak=True)
+            self.assertEqual(weak.nodes, 0)
+            self.assertEqual(weak.score, first.result())
+        with PositionStore(self.path) as store:
+            solver = Solver(4, 5, 4, tableSize=100003, store=store)
+            self.assertEqual(solver.solve(board, player).nodes, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()